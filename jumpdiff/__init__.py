@@ -1,7 +1,9 @@
 from .q_ratio import q_ratio
 from .kernels import epanechnikov, silvermans_rule
-from .moments import moments, corrections
-from .jd_process import jd_process
+from .moments import moments, corrections, MomentsAccumulator, rolling_moments
+from .moments import ensemble_moments, moments_at, cv_bandwidth
+from .jd_process import jd_process, jd_process_blocks, jd_ensemble
+from .jd_process import jd_ou_process
 from .parameters import jump_amplitude, jump_rate
 from .formulae import m_formula, f_formula, f_formula_solver
 
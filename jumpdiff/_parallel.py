@@ -0,0 +1,15 @@
+## Helpers shared by the estimators and the simulators to run in parallel
+
+import os
+
+def _workers(n_jobs: int = None) -> int:
+    """
+    Number of workers for ``n_jobs``, with ``-1`` for all processors.
+    """
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        return max(1, (os.cpu_count() or 1) + 1 + n_jobs)
+
+    assert n_jobs != 0, "n_jobs must be nonzero"
+    return int(n_jobs)
@@ -20,49 +20,196 @@ def bincount2(x, weights, minlength=0):
     if (ans_size < minlength):
         ans_size = minlength
 
-    csr = csr_matrix((np.ones(x.shape[0]), (np.arange(x.shape[0]), x)), shape=[
-                     x.shape[0], ans_size])
-    return weights * csr
+    # One nonzero per row, so the indices of the sparse matrix are x itself
+    csr = csr_matrix((np.ones(x.shape[0]), x, np.arange(x.shape[0] + 1)),
+                     shape=[x.shape[0], ans_size])
+    return (csr.T @ weights.T).T
+
+def bincount3(x, weights, minlength=0):
+    # A single bincount over all weights, each row offset by the histogram
+    # size. Fastest for sparse histograms, i.e., more bins than samples
+    ans_size = max(minlength, x.max() + 1 if x.size else 0)
+
+    index = np.arange(weights.shape[0]) * ans_size
+    index = (index[:, None] + x[None, :]).ravel()
+    return np.bincount(index, weights.ravel(),
+        minlength = weights.shape[0] * ans_size).reshape(-1, ans_size)
+
+_bincounts = {'loop': bincount1, 'sparse': bincount2, 'flat': bincount3}
+
+def bincount(x, weights, minlength=0, method='auto'):
+    """
+    Counts the occurrences of each value in ``x`` for each row of ``weights``,
+    returning an array of shape ``(weights.shape[0], minlength)``.
+
+    ``method`` selects the strategy: ``'loop'`` calls ``np.bincount`` once per
+    row of weights, ``'sparse'`` multiplies the weights with a sparse
+    indicator matrix, and ``'flat'`` offsets the indices of each row and calls
+    ``np.bincount`` once over all rows. ``'auto'`` picks ``'flat'`` when there
+    are more bins than samples, and ``'loop'`` otherwise, which measures
+    fastest for dense histograms at any number of weights.
+    """
+    weights = np.asarray(weights)
+    if weights.ndim == 1:
+        return np.bincount(x, weights, minlength = minlength)
+
+    if method == 'auto':
+        method = 'flat' if minlength > x.size else 'loop'
+
+    if method not in _bincounts:
+        raise ValueError("method must be one of {}".format(
+            ', '.join(repr(m) for m in ('auto', *_bincounts))))
+
+    return np.asarray(_bincounts[method](x, weights, minlength = minlength))
 
 _range = range
 
 
+def _get_outer_edges(a, range, bw):
+    """
+    Determine the outer bin edges to use, from either the data or the range
+    argument
+    """
+    if range is not None:
+        first_edge, last_edge = range
+        if first_edge > last_edge:
+            raise ValueError(
+                'max must be larger than min in range parameter.')
+        if not (np.isfinite(first_edge) and np.isfinite(last_edge)):
+            raise ValueError(
+                "supplied range of [{}, {}] "
+                " is not finite".format(first_edge, last_edge))
+    elif a.size == 0:
+        # handle empty arrays. Can't determine range, so use 0-1.
+        first_edge, last_edge = 0, 1
+    else:
+        first_edge, last_edge = a.min() - bw, a.max() + bw
+        if not (np.isfinite(first_edge) and np.isfinite(last_edge)):
+            raise ValueError(
+                "autodetected range of [{}, {}] "
+                "is not finite".format(first_edge, last_edge))
+
+    # expand empty range to avoid divide by zero
+    if first_edge == last_edge:
+        first_edge = first_edge - 0.5
+        last_edge = last_edge + 0.5
+
+    return first_edge, last_edge
+
+
+def _is_uniform(edges, rtol=1e-6):
+    """
+    Checks if the bin edges are equally spaced, e.g. generated by ``linspace``.
+    """
+    dedges = np.diff(edges)
+    return dedges.size > 0 and dedges[0] > 0 and np.allclose(
+        dedges, dedges[0], rtol=rtol, atol=0)
+
+
+def _uniform_index(x, edges, out=None):
+    """
+    Bin index of each sample for equally spaced ``edges``, computed directly as
+    ``(x - min) / dx`` instead of a binary search over the edges.
+
+    Identical to ``np.searchsorted(edges, x, side='right')``, with the samples
+    lying on the rightmost edge shifted into the last bin. The arithmetic guess
+    is off by at most one bin due to rounding, and is corrected by comparing
+    with the neighbouring edges.
+    """
+    E = edges.size
+    dx = (edges[-1] - edges[0]) / (E - 1)
+
+    if out is None:
+        out = np.empty(x.shape, dtype=np.intp)
+
+    t = np.subtract(x, edges[0])
+    t /= dx
+    np.floor(t, out=t)
+    np.clip(t, -1, E - 1, out=t)
+    np.copyto(out, t, casting='unsafe')
+    out += 1
+
+    # Correct rounding with the edges, padded so the gathers never go out of
+    # bounds: x must lie in [edges_[out], edges_[out + 1])
+    edges_ = np.concatenate(([-np.inf], edges, [np.inf]))
+    out -= x < edges_[out]
+    out += x >= edges_[out + 1]
+
+    # Samples on the rightmost edge are counted in the last bin
+    out -= x == edges[-1]
+
+    return out
+
+
+def _linear_bins(sample, edges, nbin, weights):
+    """
+    Indices in the flattened histogram (with the outlier bins) of each of the
+    ``2**D`` bin centres nearest to each sample, with the weights split between
+    them linearly in the distance. Samples outside the edges are weighted
+    zero, and the ones outside the outer bin centres go to the outer bins.
+    """
+    N, D = sample.shape
+    if weights is None:
+        weights = np.ones(N)
+
+    index, frac = D * [None], D * [None]
+    for i in _range(D):
+        if not _is_uniform(edges[i]):
+            raise ValueError("linear binning needs equally spaced bins")
+
+        B = edges[i].size - 1
+        dx = (edges[i][-1] - edges[i][0]) / B
+        outside = ((sample[:, i] < edges[i][0]) |
+                   (sample[:, i] > edges[i][-1]))
+
+        # Position relative to the bin centres, the centre to its left (in
+        # the histogram with outlier bins), and the share of the right one
+        t = np.subtract(sample[:, i], edges[i][0])
+        t /= dx
+        t -= 0.5
+        np.clip(t, 0, B - 1, out=t)
+        index[i] = np.minimum(t.astype(np.intp), max(B - 2, 0))
+        t -= index[i]
+        index[i] += 1
+        frac[i] = t
+
+        if outside.any():
+            weights = weights * ~outside
+
+    # Weights of the left and right centres of the first dimension, split
+    # again along each further dimension
+    right = weights * frac[0]
+    corners = [(index[0], weights - right), (index[0] + 1, right)]
+    for i in _range(1, D):
+        split = []
+        for xy, w in corners:
+            right = w * frac[i]
+            split += [(xy * nbin[i] + index[i], w - right),
+                      (xy * nbin[i] + index[i] + 1, right)]
+        corners = split
+
+    return corners
+
+
 # An alternative to Numpy's histogramdd, supporting a weights matrix
 # Part of the following code is licensed under the BSD-3 License (from Numpy)
 def histogramdd(sample, bins=10, range=None, normed=None, weights=None,
-                density=None, bw=0.0):
-
-    def _get_outer_edges(a, range, bw):
-        """
-        Determine the outer bin edges to use, from either the data or the range
-        argument
-        """
-        if range is not None:
-            first_edge, last_edge = range
-            if first_edge > last_edge:
-                raise ValueError(
-                    'max must be larger than min in range parameter.')
-            if not (np.isfinite(first_edge) and np.isfinite(last_edge)):
-                raise ValueError(
-                    "supplied range of [{}, {}] "
-                    " is not finite".format(first_edge, last_edge))
-        elif a.size == 0:
-            # handle empty arrays. Can't determine range, so use 0-1.
-            first_edge, last_edge = 0, 1
-        else:
-            first_edge, last_edge = a.min() - bw, a.max() + bw
-            if not (np.isfinite(first_edge) and np.isfinite(last_edge)):
-                raise ValueError(
-                    "autodetected range of [{}, {}] "
-                    "is not finite".format(first_edge, last_edge))
-
-        # expand empty range to avoid divide by zero
-        if first_edge == last_edge:
-            first_edge = first_edge - 0.5
-            last_edge = last_edge + 0.5
+                density=None, bw=0.0, index=None, method='auto',
+                binning='nearest'):
+    """
+    Computes the multidimensional histogram of ``sample`` for a matrix of
+    weights, each row of ``weights`` generating its own histogram.
 
-        return first_edge, last_edge
+    Equally spaced bins, as generated when ``bins`` is an integer, are indexed
+    arithmetically in a single pass. A preallocated integer array of shape
+    ``(N,)`` or ``(D, N)`` can be given as ``index`` to hold the bin indices.
+    ``method`` selects the strategy of ``bincount`` to accumulate the weights.
 
+    ``binning='linear'`` splits each sample between the nearest bin centres
+    of each dimension, linearly in the distance to them (cloud-in-cell), for
+    equally spaced bins only. Smoothed with a kernel, linearly binned samples
+    are as accurate on a grid several times coarser as with ``'nearest'``.
+    """
     try:
         # Sample is an ND-array.
         N, D = sample.shape
@@ -114,29 +261,48 @@ def histogramdd(sample, bins=10, range=None, normed=None, weights=None,
         nbin[i] = len(edges[i]) + 1  # includes an outlier on each end
         dedges[i] = np.diff(edges[i])
 
+    if binning == 'linear':
+        corners = _linear_bins(sample, edges, nbin, weights)
+        weights = corners[0][1]
+        index = None
+    elif binning != 'nearest':
+        raise ValueError("binning must be 'nearest' or 'linear'")
+
+    if index is not None:
+        index = np.reshape(index, (D, N))
+
     # Compute the bin number each sample falls into.
-    Ncount = tuple(
+    Ncount = D * [None]
+    for i in _range(D if binning == 'nearest' else 0):
+        out = None if index is None else index[i]
+        if np.ndim(bins[i]) == 0 or _is_uniform(edges[i]):
+            Ncount[i] = _uniform_index(sample[:, i], edges[i], out=out)
+            continue
+
         # avoid np.digitize to work around gh-11022
-        np.searchsorted(edges[i], sample[:, i], side='right')
-        for i in _range(D)
-    )
+        Ncount[i] = np.searchsorted(edges[i], sample[:, i], side='right')
 
-    # Using digitize, values that fall on an edge are put in the right bin.
-    # For the rightmost bin, we want values equal to the right edge to be
-    # counted in the last bin, and not as an outlier.
-    for i in _range(D):
-        # Find which points are on the rightmost edge.
+        # Using digitize, values that fall on an edge are put in the right bin.
+        # For the rightmost bin, we want values equal to the right edge to be
+        # counted in the last bin, and not as an outlier.
         on_edge = (sample[:, i] == edges[i][-1])
         # Shift these points one bin to the left.
         Ncount[i][on_edge] -= 1
 
     # Compute the sample indices in the flattened histogram matrix.
     # This raises an error if the array is too large.
-    xy = np.ravel_multi_index(Ncount, nbin)
+    if binning == 'linear':
+        hist = sum(bincount(xy, w, minlength=nbin.prod(), method=method)
+                   for xy, w in corners)
+    else:
+        if D == 1:
+            xy = Ncount[0]
+        else:
+            xy = np.ravel_multi_index(Ncount, nbin)
 
-    # Compute the number of repetitions in xy and assign it to the
-    # flattened histmat.
-    hist = bincount1(xy, weights, minlength=nbin.prod())
+        # Compute the number of repetitions in xy and assign it to the
+        # flattened histmat.
+        hist = bincount(xy, weights, minlength=nbin.prod(), method=method)
 
     # Shape into a proper matrix
     if weights.ndim == 1:
@@ -145,7 +311,7 @@ def histogramdd(sample, bins=10, range=None, normed=None, weights=None,
         hist = hist.reshape((weights.shape[0], *nbin))
 
     # This preserves the (bad) behavior observed in gh-7845, for now.
-    hist = hist.astype(float, casting='safe')
+    hist = hist.astype(float, casting='safe', copy=False)
 
     # Remove outliers (indices 0 and -1 for each dimension).
     core = D * (slice(1, -1),)
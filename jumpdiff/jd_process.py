@@ -4,10 +4,20 @@
 # function needs to be given. Created by Leonardo Rydin Gorjão and Pedro G. Lind
 
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from scipy.signal import lfilter
+
+from .binning import _is_uniform
+from ._parallel import _workers
+
+# Number of integration steps of each block, when integrating in blocks
+_BLOCK = 2**16
 
 def jd_process(time: float, delta_t: float, a: callable, b: callable,
         xi: float, lamb: float, init: float = None, solver: str = 'Euler',
-        b_prime: callable = None) -> np.ndarray:
+        b_prime: callable = None, n_paths: int = None,
+        out: np.ndarray = None, seed = None, block_size: int = None,
+        decimate: int = 1) -> np.ndarray:
     r"""
     Integrates a jump-diffusion process with drift a(x), diffusion b(x), jump
     amplitude xi (:math:`\xi`), and jump rate lamb (:math:`\lambda`).
@@ -30,15 +40,26 @@ def jd_process(time: float, delta_t: float, a: callable, b: callable,
     delta_t: float > 0
         Time sampling, the smaller the better.
 
-    a: callable
+    a: callable or tuple
         The drift function. Can be a function of a ``lambda``. For an
         Ornstein─Uhlenbeck process with drift ``-2x``, a takes the form
             ``a =  lambda x: -2x``.
+        Can also be tabulated as ``(grid, values)``, e.g., estimated by
+        ``edges, moments = moments(...)`` as ``(edges, moments[1]/delta_t)``,
+        which is interpolated linearly in the grid, and held constant outside.
 
-    b: callable
+    b: callable or tuple
         The diffusion function. Can be a function of a ``lambda``. For an
         Ornstein─Uhlenbeck process with diffusion ``1``, a takes the form
             ``b =  lambda x: 1``.
+        Can also be tabulated as ``(grid, values)``, interpolated as ``a``.
+        The table is the amplitude b(x) itself, not b(x)²: the second moment
+        estimated by ``moments(..., correction=True, norm=False)`` is
+        b(x)² ``delta_t``, plus ``xi * lamb * delta_t`` of the jumps, so that
+        ``(edges, np.sqrt(moments[2]/delta_t - xi * lamb))`` is the table, or
+        ``(edges, np.sqrt(moments[2]/delta_t))`` without jumps. For the
+        Milstein solver ``b_prime`` is then the derivative of the table, if not
+        given.
 
     xi: float > 0
         Variance of the jump amplitude, which will be turned into a normal
@@ -59,13 +80,299 @@ def jd_process(time: float, delta_t: float, a: callable, b: callable,
         introduce as well the derivative of b(x), i.e., b'(x), as the argument
         ``b_prime``.
 
+    n_paths: int (default ``None``)
+        Number of independent paths to integrate at once. The ensemble is
+        advanced a step at a time, so ``a``, ``b`` (and ``b_prime``) are called
+        once per step with an array of the ``n_paths`` states, and must take
+        arrays, e.g. ``a = lambda x: -2*x``. If ``None`` integrates a single
+        path, calling them with the state of the path.
+
+    out: np.ndarray or str (default ``None``)
+        Array of shape ``(n_paths, int(time/delta_t))``, or of size
+        ``int(time/delta_t)`` for a single path, to write the paths into, e.g.,
+        a ``np.memmap``. If a path, the paths are written to a new ``.npy``
+        file, integrating in blocks, and returned memory-mapped.
+
+    seed: int, np.random.SeedSequence or np.random.Generator (default ``None``)
+        Seed of the random numbers, or a ``np.random.Generator`` to draw them
+        from. If ``None`` draws from the global ``np.random`` state.
+
+    block_size: int (default ``None``)
+        If given integrates in blocks of ``block_size`` steps, drawing the
+        noise of each block in turn, which bounds the memory used besides the
+        output (see ``jd_process_blocks``).
+
+    decimate: int (default ``1``)
+        Keep only every ``decimate``-th sample, starting with the first,
+        integrating in blocks.
+
+    Returns
+    -------
+    X: np.array
+        Timeseries of size ``int(time/delta_t)``, or of shape
+        ``(n_paths, int(time/delta_t))`` for ``n_paths`` paths. With
+        ``decimate`` the last axis is of size
+        ``(int(time/delta_t) - 1)//decimate + 1``.
+    """
+
+    a, b, b_prime = _coefficients(a, b, b_prime, solver)
+    _check(time, delta_t, a, b, xi, lamb, solver, b_prime)
+
+    # Define total length of timeseries, and shape of the paths
+    length = int(time/delta_t)
+    assert n_paths is None or n_paths > 0, "n_paths must be positive"
+    shape = (length,) if n_paths is None else (int(n_paths), length)
+
+    # Generator of the random numbers
+    rng = np.random if seed is None else np.random.default_rng(seed)
+
+    if block_size is not None or decimate > 1 or isinstance(out, str):
+        # Integrate in blocks, keeping every decimate-th sample
+        size = (*shape[:-1], (length - 1) // decimate + 1)
+        if isinstance(out, str):
+            out = np.lib.format.open_memmap(out, mode='w+', shape=size)
+        X = _output(out, size)
+
+        start = 0
+        for block in _blocks(shape, delta_t, a, b, xi, lamb, init, solver,
+                b_prime, rng, block_size or _BLOCK, decimate):
+            X[..., start:start + block.shape[-1]] = block
+            start += block.shape[-1]
+
+        if isinstance(X, np.memmap):
+            X.flush()
+        return X
+
+    # Initialise the array X, one path per row
+    X = _output(out, shape)
+
+    # randomise initial starting value or use given
+    X[..., 0] = _init(init, delta_t, shape[:-1], rng)
+
+    _integrate(X, delta_t, a, b, xi, lamb, solver, b_prime, rng)
+
+    return X
+
+
+def jd_ou_process(time: float, delta_t: float, theta: float, sigma: float,
+        xi: float, lamb: float, init: float = None, mu: float = 0.,
+        n_paths: int = None, out: np.ndarray = None,
+        seed = None) -> np.ndarray:
+    r"""
+    Generates an Ornstein─Uhlenbeck jump-diffusion process, with linear drift
+    and constant diffusion,
+
+    .. math::
+
+       \mathrm{d} X(t) = -\theta (X(t) - \mu)\;\mathrm{d} t
+       + \sigma\;\mathrm{d} W(t) + \xi\;\mathrm{d} J(t),
+
+    with :math:`J` Poisson with jump rate :math:`\lambda`, i.e., ``jd_process``
+    with ``a = lambda x: -theta*(x - mu)`` and ``b = lambda x: sigma``. Instead
+    of integrating step by step it samples the exact transition of the process
+    over ``delta_t``, so the timeseries has the exact statistics for any
+    ``delta_t``, and is generated without calling Python at each step.
+
+    Parameters
+    ----------
+    time: float > 0
+        Total time. Positive float or int.
+
+    delta_t: float > 0
+        Time sampling, not limited in size.
+
+    theta: float
+        Rate of mean reversion, i.e., the drift is ``-theta*(x - mu)``.
+
+    sigma: float
+        The (constant) diffusion.
+
+    xi, lamb, init, n_paths, out, seed:
+        As in ``jd_process``.
+
+    mu: float (default ``0``)
+        Mean of the process.
+
     Returns
     -------
     X: np.array
-        Timeseries of size ``int(time/delta_t)``
+        Timeseries of size ``int(time/delta_t)``, or of shape
+        ``(n_paths, int(time/delta_t))`` for ``n_paths`` paths.
+    """
+
+    assert time > 0, "Total integration time must be positive"
+    assert delta_t > 0, "Time sampling must be positive"
+    assert isinstance(lamb, int) or isinstance(lamb, float), ("'lamb' is not an"
+            " int or float")
+    assert isinstance(xi, int) or isinstance(xi, float), ("'xi' is not an int "
+            "or float")
+
+    length = int(time/delta_t)
+    assert n_paths is None or n_paths > 0, "n_paths must be positive"
+    shape = (length,) if n_paths is None else (int(n_paths), length)
+
+    rng = np.random if seed is None else np.random.default_rng(seed)
+
+    X = _output(out, shape)
+    X[..., 0] = _init(init, delta_t, shape[:-1], rng)
+
+    # Decay over a step, and variance of the diffusion over a step
+    decay = np.exp(-theta * delta_t)
+    var = -np.expm1(-2 * theta * delta_t) / (2 * theta) if theta else delta_t
+
+    # Generate the Gaussian noise of the steps
+    dx = rng.normal(loc=0, scale=sigma * np.sqrt(var), size=shape)
+    dx += mu * (1 - decay)
+
+    # Generate the Poissonian Jumps. Each decays from its time s within the
+    # step, so the sum of k jumps is ~ N(0,√(xi·Σ exp(-2·theta·(delta_t - s))))
+    dJ = rng.poisson(lam=lamb * delta_t, size=shape)
+    jumps = dJ > 0
+    if theta:
+        s = rng.random(dJ.sum()) * delta_t
+        decays = np.bincount(np.repeat(np.arange(dJ.size), dJ.ravel()),
+            np.exp(-2 * theta * s), minlength=dJ.size).reshape(shape)[jumps]
+    else:
+        decays = dJ[jumps]
+    dx[jumps] += rng.normal(0, np.sqrt(xi * decays))
+
+    # The recursion X[i] = decay * X[i-1] + dx[i]
+    X[..., 1:] = lfilter([1.], [1., -decay], dx[..., 1:], axis=-1,
+        zi=decay * X[..., :1])[0]
+
+    return X
+
+
+def jd_process_blocks(time: float, delta_t: float, a: callable, b: callable,
+        xi: float, lamb: float, init: float = None, solver: str = 'Euler',
+        b_prime: callable = None, n_paths: int = None, seed = None,
+        block_size: int = 2**16, decimate: int = 1):
+    r"""
+    Integrates a jump-diffusion process as ``jd_process``, in blocks of
+    ``block_size`` steps, yielding the samples of each block as it is
+    integrated. The noise is drawn per block and the state carried over to the
+    next, so the memory needed is set by ``block_size`` rather than by
+    ``time/delta_t``. With ``decimate`` only every ``decimate``-th sample is
+    kept, to integrate with a fine ``delta_t`` and store a coarser timeseries.
+
+    Parameters
+    ----------
+    time, delta_t, a, b, xi, lamb, init, solver, b_prime, n_paths, seed:
+        As in ``jd_process``.
+
+    block_size: int (default ``2**16``)
+        Number of integration steps of each block.
+
+    decimate: int (default ``1``)
+        Keep every ``decimate``-th sample, starting with the first.
+
+    Yields
+    ------
+    X: np.array
+        The kept samples of each block, along the last axis. Concatenated they
+        form the timeseries of size ``(int(time/delta_t) - 1)//decimate + 1``,
+        of shape ``(n_paths, ...)`` for ``n_paths`` paths.
+    """
+
+    a, b, b_prime = _coefficients(a, b, b_prime, solver)
+    _check(time, delta_t, a, b, xi, lamb, solver, b_prime)
+
+    length = int(time/delta_t)
+    assert n_paths is None or n_paths > 0, "n_paths must be positive"
+    shape = (length,) if n_paths is None else (int(n_paths), length)
+
+    rng = np.random if seed is None else np.random.default_rng(seed)
+
+    for block in _blocks(shape, delta_t, a, b, xi, lamb, init, solver,
+            b_prime, rng, block_size, decimate):
+        yield block.copy()
+
+
+def _coefficients(a, b, b_prime: callable, solver: str) -> tuple:
+    """
+    Drift, diffusion, and derivative of the diffusion, as functions, turning
+    the ones given as tables ``(grid, values)`` into a ``_Table``.
+    """
+    if isinstance(a, tuple):
+        a = _Table(*a)
+
+    if isinstance(b, tuple):
+        b = _Table(*b)
+        if solver == 'Milstein' and b_prime is None:
+            b_prime = _Table(b.grid, np.gradient(b.values, b.grid))
+
+    if isinstance(b_prime, tuple):
+        b_prime = _Table(*b_prime)
+
+    return a, b, b_prime
+
+
+class _Table:
     """
+    Function tabulated as ``values`` over ``grid``, interpolated linearly and
+    held constant outside of the grid. On equally spaced grids the interval of
+    ``x`` is computed directly as ``(x - min) / dx``, with plain float
+    arithmetic when called with the state of a single path. ``grid`` and
+    ``values`` of shape ``(bins, lags)``, as given by ``moments``, are taken at
+    the first lag.
+    """
+    def __init__(self, grid: np.ndarray, values: np.ndarray):
+        grid = np.asarray(grid, dtype=float)
+        values = np.asarray(values, dtype=float)
+        if grid.ndim > 1:
+            grid = grid[:, 0]
+        if values.ndim > 1:
+            values = values[:, 0]
+
+        assert grid.ndim == 1 and grid.size > 1, ("the grid must have at least"
+            " two points")
+        assert values.shape == grid.shape, ("the table must have a value at "
+            "each point of the grid")
+
+        self.grid = grid
+        self.values = values
+        self.uniform = _is_uniform(grid)
+
+        # Grid point of x is (x - start) * scale, and the slope of the values
+        # in each interval, 0 past the last point
+        self.start = float(grid[0])
+        self.scale = float((grid.size - 1) / (grid[-1] - grid[0]))
+        self.slopes = np.append(np.diff(values), 0.)
+
+        self._values = values.tolist()
+        self._slopes = self.slopes.tolist()
+
+    def __call__(self, x):
+        if not self.uniform:
+            return np.interp(x, self.grid, self.values)
+
+        if not isinstance(x, np.ndarray) or x.ndim == 0:
+            i = (float(x) - self.start) * self.scale
+            if not i > 0.:
+                # the first value, or NaN for NaN
+                return self._values[0] if i <= 0. else i
+            j = int(i)
+            if j >= len(self._values) - 1:
+                return self._values[-1]
+            return self._values[j] + (i - j) * self._slopes[j]
+
+        # np.interp has less overhead for few states
+        if x.size < 512:
+            return np.interp(x, self.grid, self.values)
+
+        i = (x - self.start) * self.scale
+        np.maximum(i, 0, out=i)
+        np.minimum(i, self.grid.size - 1, out=i)
+        # Interval of each x, of the first for NaN, which remains NaN
+        j = np.fmax(i, 0).astype(np.intp)
+        return self.values[j] + (i - j) * self.slopes[j]
 
-    # assert and conditions
+
+def _check(time: float, delta_t: float, a: callable, b: callable, xi: float,
+        lamb: float, solver: str, b_prime: callable):
+    """
+    Asserts the arguments of the integrators.
+    """
     assert time > 0, "Total integration time must be positive"
     assert delta_t > 0, "Time sampling must be positive"
     if solver == 'Milstein':
@@ -80,44 +387,188 @@ def jd_process(time: float, delta_t: float, a: callable, b: callable,
             "or float")
 
 
-    # Define total length of timeseries
-    length = int(time/delta_t)
+def _output(out: np.ndarray, shape: tuple) -> np.ndarray:
+    """
+    Array to write the paths into, ``out`` if given.
+    """
+    if out is None:
+        return np.zeros(shape)
+
+    assert out.shape == shape, ("'out' must be of shape {}".format(shape))
+    return out
 
-    # Initialise the array X
-    X = np.zeros(length)
 
-    # randomise initial starting value or use given (after assert)
+def _init(init: float, delta_t: float, size: tuple, rng = np.random):
+    """
+    Initial values of the paths, the given ``init`` or random values from
+    a normal distribution ~ N(0,√delta_t).
+    """
     if init is None:
-        X[0] = np.random.normal(loc=0, scale=np.sqrt(delta_t), size=1)
-    else:
-        assert isinstance(init, int) or isinstance(init, float), ("'init' is "
-            "not an int or float")
-        X[0] = float(init)
+        return rng.normal(loc=0, scale=np.sqrt(delta_t), size=size or None)
+
+    assert isinstance(init, int) or isinstance(init, float), ("'init' is "
+        "not an int or float")
+    return float(init)
+
+
+def _blocks(shape: tuple, delta_t: float, a: callable, b: callable,
+        xi: float, lamb: float, init: float, solver: str, b_prime: callable,
+        rng, block_size: int, decimate: int):
+    """
+    Integrates the paths in blocks of ``block_size`` steps into a single
+    buffer, yielding views of the samples kept of each block. The last sample
+    of a block is the first of the next.
+    """
+    assert block_size > 0, "block_size must be positive"
+    assert decimate > 0, "decimate must be positive"
+
+    length = shape[-1]
+    buffer = np.zeros((*shape[:-1], min(block_size, length - 1) + 1))
+    buffer[..., 0] = _init(init, delta_t, shape[:-1], rng)
+
+    # Index of the sample buffer[..., 0] in the timeseries, and of the first
+    # new sample in the buffer, which for the first block is the initial value
+    start, new = 0, 0
+    while new == 0 or start + 1 < length:
+        steps = min(block_size, length - 1 - start)
+        block = buffer[..., :steps + 1]
+        _integrate(block, delta_t, a, b, xi, lamb, solver, b_prime, rng)
+
+        yield block[..., new + (-(start + new)) % decimate::decimate]
+
+        buffer[..., 0] = block[..., -1]
+        start, new = start + steps, 1
+
+
+def _integrate(X: np.ndarray, delta_t: float, a: callable, b: callable,
+        xi: float, lamb: float, solver: str, b_prime: callable,
+        rng = np.random):
+    """
+    Integrates ``X[..., 1:]`` in place from ``X[..., 0]``. A single path is
+    integrated by calling ``a``, ``b`` with its state, ``n_paths`` paths, one
+    per row, by advancing the whole ensemble at each step.
+    """
+    length = X.shape[-1]
 
     # Generate the Gaussian noise
-    dw = np.random.normal(loc=0, scale=np.sqrt(delta_t), size=length)
+    dw = rng.normal(loc=0, scale=np.sqrt(delta_t), size=X.shape)
 
     # Generate the Poissonian Jumps
-    dJ = np.random.poisson(lam=lamb * delta_t, size=length)
+    dJ = rng.poisson(lam=lamb * delta_t, size=X.shape)
+    J = _jumps(dJ, xi, rng)
+
+    # Generate corrective terms of the Milstein integration method
+    if solver == 'Milstein':
+        dw_2 = (dw**2 - delta_t) * 0.5
 
+    if X.ndim > 1:
+        # Integration of the ensemble, either Euler or Milstein
+        for i in range(1, length):
+            x = X[:, i-1]
+            X[:, i] = x + a(x) * delta_t + b(x) * dw[:, i] + J[:, i]
+            if solver == 'Milstein':
+                X[:, i] += b(x) * b_prime(x) * dw_2[:, i]
+        return
 
     # Integration, either Euler
     if solver == 'Euler':
         for i in range(1, length):
-            X[i] = X[i-1] + a(X[i-1]) * delta_t + b(X[i-1]) * dw[i]
-            if dJ[i] > 0.:
-                # correction by @JChonpca_Huang (issue #5)
-                X[i] += np.sum(np.random.normal(0, np.sqrt(xi), size=dJ[i]))
+            X[i] = X[i-1] + a(X[i-1]) * delta_t + b(X[i-1]) * dw[i] + J[i]
 
     if solver == 'Milstein':
-        # Generate corrective terms of the Milstein integration method
-        dw_2 = (dw**2 - delta_t) * 0.5
-
         for i in range(1, length):
             X[i] = X[i-1] + a(X[i-1]) * delta_t + b(X[i-1]) * dw[i] \
-                    + b(X[i-1]) * b_prime(X[i-1]) * dw_2[i]
-            if dJ[i] > 0.:
-                # correction by @JChonpca_Huang (issue #5)
-                X[i] += np.sum(np.random.normal(0, np.sqrt(xi), size=dJ[i]))
+                    + b(X[i-1]) * b_prime(X[i-1]) * dw_2[i] + J[i]
+
+
+def _jumps(dJ: np.ndarray, xi: float, rng = np.random) -> np.ndarray:
+    """
+    Jump contributions of each step, given the number of jumps ``dJ`` in each.
+    The sum of k independent jumps ~ N(0,√xi) is distributed as N(0,√(k·xi)),
+    so a single draw per step with jumps replaces drawing each jump (correction
+    by @JChonpca_Huang, issue #5).
+    """
+    J = np.zeros(dJ.shape)
+    jumps = dJ > 0
+    J[jumps] = rng.normal(0, np.sqrt(xi * dJ[jumps]))
+
+    return J
+
+
+def jd_ensemble(n_paths: int, time: float, delta_t: float, a: callable,
+        b: callable, xi: float, lamb: float, init: float = None,
+        solver: str = 'Euler', b_prime: callable = None, seed = None,
+        batch_size: int = 64, n_jobs: int = None,
+        executor = None) -> np.ndarray:
+    r"""
+    Integrates an ensemble of ``n_paths`` independent paths of a jump-diffusion
+    process, in batches of ``batch_size`` paths integrated by
+    ``jd_process(..., n_paths=batch_size)``. Each batch draws from its own
+    child of ``np.random.SeedSequence(seed)``, so the ensemble only depends on
+    ``seed`` and ``batch_size``, and is identical whether the batches are
+    integrated serially or in parallel, on any number of workers.
+
+    Parameters
+    ----------
+    n_paths: int
+        Number of paths of the ensemble.
+
+    time, delta_t, a, b, xi, lamb, init, solver, b_prime:
+        As in ``jd_process``, with ``a``, ``b`` (and ``b_prime``) taking arrays.
+
+    seed: int or np.random.SeedSequence (default ``None``)
+        Seed of the ensemble. If ``None`` draws fresh entropy from the system.
+
+    batch_size: int (default ``64``)
+        Number of paths integrated at once by each task.
+
+    n_jobs: int (default ``None``)
+        Number of processes to integrate the batches on. ``None`` or ``1``
+        integrates serially, ``-1`` uses all cores. In parallel ``a``, ``b``
+        and ``b_prime`` must be picklable, i.e., module-level functions rather
+        than ``lambda``.
+
+    executor: concurrent.futures.Executor (default ``None``)
+        Executor to integrate the batches on, instead of a pool of ``n_jobs``
+        processes.
+
+    Returns
+    -------
+    X: np.array
+        The paths, of shape ``(n_paths, int(time/delta_t))``.
+    """
+
+    assert n_paths > 0, "n_paths must be positive"
+    assert batch_size > 0, "batch_size must be positive"
+
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+
+    starts = range(0, n_paths, batch_size)
+    seeds = seed.spawn(len(starts))
+
+    X = np.zeros((n_paths, int(time/delta_t)))
+
+    if executor is None and _workers(n_jobs) == 1:
+        for start, child in zip(starts, seeds):
+            stop = min(start + batch_size, n_paths)
+            jd_process(time, delta_t, a, b, xi, lamb, init, solver, b_prime,
+                       n_paths=stop - start, out=X[start:stop], seed=child)
+        return X
+
+    own = executor is None
+    if own:
+        executor = ProcessPoolExecutor(_workers(n_jobs))
+
+    try:
+        futures = [executor.submit(jd_process, time, delta_t, a, b, xi, lamb,
+                       init, solver, b_prime, n_paths=min(batch_size,
+                       n_paths - start), seed=child)
+                   for start, child in zip(starts, seeds)]
+        for start, future in zip(starts, futures):
+            X[start:start + batch_size] = future.result()
+    finally:
+        if own:
+            executor.shutdown()
 
     return X
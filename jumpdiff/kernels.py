@@ -5,7 +5,9 @@
 # of Open Source Software, 4(44), 1693, doi: 10.21105/joss.01693
 
 import numpy as np
+from collections import OrderedDict
 from functools import wraps
+from scipy.fft import rfftn, next_fast_len
 from scipy.special import gamma, factorial2
 from scipy.stats import norm
 
@@ -104,9 +106,135 @@ def quartic(x: np.ndarray, dims: int) -> np.ndarray:
 
 _kernels = {epanechnikov, gaussian, uniform, triagular, quartic}
 
+# Kernels with compact support, vanishing at distances larger than bw
+_compact = {epanechnikov, uniform, triagular, quartic}
+
+def _support(kernel: callable, bw: float) -> float:
+    # Distance beyond which the kernel vanishes, or for the Gaussian is
+    # negligible (below 1e-13 of its peak)
+    return bw if kernel in _compact else 8.0 * bw
+
 
 def silvermans_rule(timeseries: np.ndarray) -> float:
     n = timeseries.size
     sigma = np.std(timeseries, axis=0).max()
 
+    return _silvermans_bw(sigma, n)
+
+def _silvermans_bw(sigma: float, n: int) -> float:
     return  ( (4.0 * sigma**5) / (3 * n)) ** (1 / 5)
+
+
+# Least recently used cache of the discretised kernels and their spectra
+_kernel_cache = OrderedDict()
+_kernel_cache_size = 32
+
+def set_kernel_cache_size(size: int):
+    """
+    Sets the maximum number of discretised kernels, and their spectra, kept in
+    the cache shared by ``moments`` and ``q_ratio``. A size of ``0`` disables
+    the cache.
+    """
+    global _kernel_cache_size
+    assert int(size) >= 0, "Cache size must be >= 0"
+
+    _kernel_cache_size = int(size)
+    while len(_kernel_cache) > _kernel_cache_size:
+        _kernel_cache.popitem(last=False)
+
+def clear_kernel_cache():
+    """
+    Empties the cache of discretised kernels and their spectra.
+    """
+    _kernel_cache.clear()
+
+def _cached(key: tuple, func: callable):
+    # Returns the cached value of key, else computes and caches func()
+    if key in _kernel_cache:
+        _kernel_cache.move_to_end(key)
+        return _kernel_cache[key]
+
+    value = func()
+    if _kernel_cache_size > 0:
+        _kernel_cache[key] = value
+        while len(_kernel_cache) > _kernel_cache_size:
+            _kernel_cache.popitem(last=False)
+
+    return value
+
+def _grid_key(edges: list) -> tuple:
+    # The spacing and number of edges of each dimension fix the kernel grid
+    return tuple((float(edge[1] - edge[0]), edge.size) for edge in edges)
+
+def _cartesian_product(arrays: np.ndarray):
+    # Taken from https://stackoverflow.com/questions/11144513
+    la = len(arrays)
+    arr = np.empty([len(a) for a in arrays] + [la], dtype=np.float64)
+    for i, a in enumerate(np.ix_(*arrays)):
+        arr[..., i] = a
+    return arr.reshape(-1, la)
+
+def _kernel_edges(edges: np.ndarray, kernel: callable = None,
+        bw: float = None):
+    # Generates the kernel edges, spanning twice the edges, or only the
+    # support (plus a vanishing point at each end) for compact kernels
+    edges_k = list()
+    for edge in edges:
+        dx = edge[1] - edge[0]
+        L = edge.size
+        if kernel in _compact:
+            L = min(L, int(np.ceil(bw / dx)) + 1)
+        edges_k.append(np.linspace(-dx * L, dx * L, int(2 * L + 1)))
+    return edges_k
+
+def _kernel(edges: np.ndarray, kernel: callable, bw: float) -> np.ndarray:
+    """
+    Discretises ``kernel`` with bandwidth ``bw`` on a grid centred at zero with
+    the same spacing as ``edges``, normalised to unit sum. Compact kernels are
+    only discretised over their support. Cached by kernel, bandwidth and grid,
+    and returned read-only.
+    """
+    def discretise():
+        edges_k = _kernel_edges(edges, kernel, bw)
+        mesh = _cartesian_product(edges_k)
+        kernel_ = kernel(mesh, bw=bw).reshape(*(edge.size for edge in edges_k))
+        kernel_ /= np.sum(kernel_)
+        kernel_.flags.writeable = False
+        return kernel_
+
+    return _cached(('kernel', kernel, float(bw), _grid_key(edges)), discretise)
+
+def _kernel_spectrum(edges: np.ndarray, kernel: callable, bw: float):
+    """
+    Real FFT of the discretised kernel for the convolution with a histogram
+    over ``edges``, keeping its shape as ``mode='same'``. The kernel is wrapped
+    around its centre, so the first ``bins`` points of the circular
+    convolution are the result, and cropped to ``bins - 1`` points each side,
+    the farthest any two bins are apart. A transform of length ``bins + h``,
+    with ``h`` the kernel half-width, is then free of aliasing. Returns the
+    spectrum and the transform shape, cached as the kernel.
+    """
+    def transform():
+        kernel_ = _kernel(edges, kernel, bw)
+
+        # Crop to the half-width that reaches within the histogram
+        half = [min((n - 1) // 2, edge.size - 2)
+                for edge, n in zip(edges, kernel_.shape)]
+        kernel_ = kernel_[tuple(slice((n - 1) // 2 - h, (n - 1) // 2 + h + 1)
+                                for n, h in zip(kernel_.shape, half))]
+
+        shape = tuple(next_fast_len(edge.size - 1 + h, real=True)
+                      for edge, h in zip(edges, half))
+
+        # Wrap the kernel around, its centre at the origin
+        wrapped = np.zeros(shape)
+        wrapped[tuple(slice(0, 2 * h + 1) for h in half)] = kernel_
+        wrapped = np.roll(wrapped, [-h for h in half],
+                          axis=tuple(range(len(half))))
+
+        spectrum = rfftn(wrapped)
+        spectrum.flags.writeable = False
+        return spectrum, shape
+
+    return _cached(('spectrum', kernel, float(bw), _grid_key(edges)),
+                   transform)
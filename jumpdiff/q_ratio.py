@@ -4,10 +4,14 @@
 # Rydin Gorjão and Pedro G. Lind for direct application.
 
 import numpy as np
-from .moments import moments
+
+from .binning import _uniform_index
+from .kernels import epanechnikov, silvermans_rule, _kernel
+from .moments import _grid, _finalise, _moments, _pair_moments, _smooth
 
 def q_ratio(lag: np.ndarray, timeseries: np.ndarray, loc: int = None,
-        correction: bool = False) -> np.ndarray:
+        correction: bool = False, n_jobs: int = None, executor = None,
+        surface: bool = False, kmc: tuple = None) -> np.ndarray:
     r"""
     q_ratio method to distinguish pure diffusion from jump-diffusion timeseries,
     Given by the relation of the 4th and 6th Kramers─Moyal coefficient with
@@ -29,19 +33,48 @@ def q_ratio(lag: np.ndarray, timeseries: np.ndarray, loc: int = None,
         A 1-dimensional timeseries.
 
     loc: float (defaul ``None``)
-        Use a particular point in space to calculate the ratio. If ``None``
-        given, the maximum of the probability density function is taken.
+        Use a particular point in space to calculate the ratio, as the index of
+        the bin in the grid of ``moments(timeseries, bins=np.array([5000]))``.
+        If ``None`` given, the maximum of the probability density function is
+        taken. The moments are only evaluated at ``loc``, from the samples
+        within the kernel's support around it, with no convolution.
 
     corrections: bool (defaul ``False``)
         Select whether to use corrective terms.
 
+    n_jobs: int (default ``None``)
+        Number of threads evaluating chunks of lags in parallel, with ``-1``
+        for all processors. If ``None`` runs serially.
+
+    executor: concurrent.futures.Executor (default ``None``)
+        An executor to evaluate the chunks of lags on instead, see
+        ``moments``.
+
+    surface: bool (default ``False``)
+        If ``True`` returns the ratio at every bin and lag, from the moments of
+        all lags computed at once, of powers 0, 4 and 6 only (all up to 6
+        with ``correction``). Here ``n_jobs`` and ``executor`` are passed on
+        as in ``moments``.
+
+    kmc: tuple (default ``None``)
+        The output ``(edges, moments)`` of ``moments`` for the timeseries, with
+        ``power >= 6`` and at the lags ``lag``, to take the ratio from instead
+        of computing the moments. Any corrections are as given, so
+        ``correction`` has no effect, and ``timeseries`` can be ``None``. If
+        ``loc`` is ``None`` the maximum of the zeroth moment at the first lag
+        is taken.
+
     Returns
     -------
     lag: np.ndarray of ints
         Same as input, but only lag > 0 and as ints.
 
+    edges: np.ndarray
+        Only with ``surface``, the centres of the bins of the ratio.
+
     ratio: np.ndarray of len(lag)
-        Ratio of the sixth-order over forth-order Kramers–Moyal coefficient.
+        Ratio of the sixth-order over forth-order Kramers–Moyal coefficient. Of
+        shape ``(bins, len(lag))`` with ``surface``.
 
     References
     ----------
@@ -58,17 +91,80 @@ def q_ratio(lag: np.ndarray, timeseries: np.ndarray, loc: int = None,
     lag = lag[lag > 0]
     lag = np.round(np.unique(lag)).astype(int)
 
+    if kmc is not None:
+        edges, temp = kmc
+        assert temp.shape[0] > 6, "'kmc' must have moments up to power 6"
+        assert temp.shape[-1] == lag.size, "'kmc' must be at the lags 'lag'"
+
+        if surface:
+            return lag, edges[:, 0], _ratio(temp[6], temp[4])
+
+        if loc == None:
+            loc = np.argmax(temp[0, :, 0])
+        return lag, _ratio(temp[6, loc], temp[4, loc])
+
     # Assert if timeseries is 1 dimensional
     if timeseries.ndim > 1:
         assert timeseries.shape[1] == 1, "Timeseries needs to be 1-dimensional"
 
+    timeseries = np.asarray_chkfinite(timeseries, dtype=float).reshape(-1, 1)
+
+    # The grid and kernel of ``moments(timeseries, bins=np.array([5000]))``
+    bw = silvermans_rule(timeseries)
+    bins = np.array([5000])
+
+    if surface:
+        # Only the powers of the ratio, unless correcting with the lower ones
+        powers = np.arange(7) if correction else np.array([0, 4, 6])
+        edges, temp = _moments(timeseries, bins, powers[:, None], lag,
+            epanechnikov, bw, 1e-10, 'auto', n_jobs=n_jobs, executor=executor)
+        if correction:
+            temp = _finalise(temp, 6, correction, False)[[0, 4, 6]]
+
+        return lag, edges[:, 0], _ratio(temp[2], temp[1])
+
+    edges = _grid(timeseries[:-1], bins, bw)
+    index = _uniform_index(timeseries[:-1, 0], edges[0]) - 1
+
     # Find maximum of distribution
     if loc == None:
-        temp = moments(timeseries, power=0, bins=np.array([5000]))[1]
-        loc = np.argmax(temp[0])
+        hist = np.bincount(index, minlength=edges[0].size - 1)[None, :]
+        loc = np.argmax(_smooth(hist.astype(float), edges, epanechnikov, bw,
+            'auto')[0])
+
+    temp = _local_moments(timeseries, index, loc, edges, np.arange(7)[:, None],
+        lag, epanechnikov, bw, 1e-10, n_jobs, executor)
+    temp = _finalise(temp, 6, correction, False)
+
+    return lag, _ratio(temp[6], temp[4])
+
+
+def _ratio(m6: np.ndarray, m4: np.ndarray) -> np.ndarray:
+    """
+    The ratio ``m6 / (5 m4)``, NaN where ``m4`` vanishes, e.g. where the moments
+    are rounded to zero for lack of data.
+    """
+    ratio = np.full(np.shape(m4), np.nan)
+    return np.divide(m6, 5 * m4, out=ratio, where=(m4 != 0))
+
+
+def _local_moments(timeseries: np.ndarray, index: np.ndarray, loc: int,
+        edges: list, powers: np.ndarray, lag: np.ndarray, kernel: callable,
+        bw: float, tol: float, n_jobs: int = None, executor = None):
+    """
+    Conditional moments at the bin ``loc`` alone, of shape ``(power + 1,
+    lags)``, equal to the bin ``loc`` of ``moments`` on the same grid. Only the
+    samples binned (into ``index``) within the kernel's window around ``loc``
+    contribute, each weighted by the kernel at its bin, so no histogram is
+    convolved.
+    """
+    kernel_ = _kernel(edges, kernel, bw)
+    h = (kernel_.size - 1) // 2
 
-    temp = moments(timeseries, power=6, bins=np.array([5000]), lag = lag,
-        correction = correction)[1]
-    ratio = temp[6,loc,:]/(5 * temp[4,loc,:])
+    # Samples within the window, and their weights
+    offset = index - loc
+    near = np.nonzero(np.abs(offset) <= h)[0]
+    weights = kernel_[h - offset[near]]
 
-    return lag, ratio
+    return _pair_moments(timeseries, near, np.zeros_like(near), weights, 1,
+        powers, lag, tol, n_jobs, executor)[:, 0]
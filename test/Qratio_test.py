@@ -1,5 +1,5 @@
 import numpy as np
-from jumpdiff import q_ratio, jd_process
+from jumpdiff import q_ratio, jd_process, moments
 
 def test_Qratio():
     for delta in [1,0.1,0.01,0.001,0.0001]:
@@ -27,3 +27,56 @@ def test_Qratio():
 
         assert isinstance(ratio, np.ndarray)
         assert ratio.shape[0] == lag.shape[0]
+
+def test_Qratio_local():
+    X = jd_process(100, 0.001, a=lambda x: -0.5*x, b=lambda x: 0.75, xi=1.5,
+            lamb=1.25, seed=0)
+    lag = np.arange(1, 100, 7)
+
+    # the mode and the ratio at it, from the full grid of moments
+    loc = np.argmax(moments(X, power=0, bins=np.array([5000]))[1][0])
+    for correction in [False, True]:
+        m = moments(X, power=6, bins=np.array([5000]), lag=lag,
+                correction=correction)[1]
+
+        _, ratio = q_ratio(lag, X, correction=correction)
+        assert np.allclose(ratio, m[6, loc]/(5*m[4, loc]))
+
+        _, ratio = q_ratio(lag, X, loc=loc + 50, correction=correction,
+                n_jobs=2)
+        assert np.allclose(ratio, m[6, loc + 50]/(5*m[4, loc + 50]))
+
+    # a last lag longer than the timeseries, with no increments
+    _, ratio = q_ratio(np.append(lag, X.size), X, correction=correction)
+    assert np.allclose(ratio[:-1], m[6, loc]/(5*m[4, loc]))
+    assert np.isnan(ratio[-1])
+
+    # the chunks of lags on processes
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(2) as executor:
+        _, ratio = q_ratio(lag, X, correction=correction, executor=executor)
+    assert np.allclose(ratio, m[6, loc]/(5*m[4, loc]))
+
+def test_Qratio_surface():
+    X = jd_process(100, 0.001, a=lambda x: -0.5*x, b=lambda x: 0.75, xi=1.5,
+            lamb=1.25, seed=0)
+    lag = np.arange(1, 100, 7)
+
+    for correction in [False, True]:
+        edges, m = moments(X, power=6, bins=np.array([5000]), lag=lag,
+                correction=correction)
+        dense = m[0] > 1e-3 * m[0].max(axis=0)
+
+        _, edges_, ratio = q_ratio(lag, X, correction=correction,
+                surface=True)
+        assert ratio.shape == (5000, lag.size)
+        assert np.allclose(edges_, edges[:, 0])
+        assert np.allclose(ratio[dense], m[6][dense]/(5*m[4][dense]),
+                rtol=1e-3)
+
+        # from the precomputed moments
+        _, _, ratio_ = q_ratio(lag, None, surface=True, kmc=(edges, m))
+        assert np.allclose(ratio_[dense], ratio[dense], rtol=1e-3)
+        _, ratio_ = q_ratio(lag, None, kmc=(edges, m))
+        _, ratio = q_ratio(lag, X, correction=correction)
+        assert np.allclose(ratio_, ratio)
@@ -2,7 +2,7 @@
 
 import numpy as np
 
-from jumpdiff.binning import histogramdd
+from jumpdiff.binning import histogramdd, bincount, bincount1, _uniform_index
 
 N = 1000000
 
@@ -22,3 +22,71 @@ def test_binning():
 
         assert np.array(
             list(map(lambda i: (hist1[i] == hist2[i, ...]), range(Nw)))).all()
+
+def test_binning_uniform():
+    for bins in [1, 7, 30, 5000]:
+        timeseries = np.random.normal(size=(N // 10, 1))
+        weights = np.random.rand(3, N // 10)
+        edges = np.linspace(timeseries.min(), timeseries.max(), bins + 1)
+
+        # samples on each edge, and just around them
+        sample = np.concatenate([timeseries[:, 0], edges,
+            np.nextafter(edges, np.inf), np.nextafter(edges, -np.inf)])
+        index = np.searchsorted(edges, sample, side='right')
+        index[sample == edges[-1]] -= 1
+
+        assert (_uniform_index(sample, edges) == index).all()
+
+        # uniform path with an index buffer against numpy
+        buffer = np.empty(N // 10, dtype=np.intp)
+        hist1 = [np.histogramdd(timeseries, bins=[edges], weights=w)[0]
+                 for w in weights]
+        hist2 = histogramdd(timeseries, bins=[edges], weights=weights,
+                            index=buffer)[0]
+
+        assert np.array(
+            list(map(lambda i: (hist1[i] == hist2[i, ...]), range(3)))).all()
+
+def test_bincount():
+    for n, bins in [(1000, 30), (1000, 5000), (N, 5000)]:
+        x = np.random.randint(0, bins, size=n)
+        for Nw in [1, 3, 7]:
+            weights = np.random.rand(Nw, n)
+            hist = bincount1(x, weights, minlength=bins)
+
+            for method in ['auto', 'loop', 'sparse', 'flat']:
+                hist_ = bincount(x, weights, minlength=bins, method=method)
+                assert hist_.shape == (Nw, bins)
+                assert np.allclose(hist, hist_)
+
+def test_binning_linear():
+    rng = np.random.default_rng(0)
+    weights = rng.random((3, 10000))
+
+    for D in [1, 2]:
+        sample = rng.normal(size=(10000, D))
+        hist, edges = histogramdd(sample, bins=20, weights=weights,
+                                  binning='linear')
+        assert hist.shape == (3, *(D * (20,)))
+
+        # the weights, and their centre of mass, are kept
+        axes = tuple(range(1, D + 1))
+        assert np.allclose(hist.sum(axis=axes), weights.sum(axis=1))
+        for i in range(D):
+            centres = edges[i][:-1] + np.diff(edges[i]) / 2
+            marginal = hist.sum(axis=tuple(a for a in axes if a != i + 1))
+            assert np.allclose(marginal @ centres, weights @ sample[:, i],
+                               atol=1e-3 * weights.sum())
+
+    # samples outside the edges are dropped, and the edges must be uniform
+    sample = rng.normal(size=(10000, 1))
+    hist, _ = histogramdd(sample, bins=[np.linspace(-1, 1, 11)],
+                          weights=weights, binning='linear')
+    inside = np.abs(sample[:, 0]) <= 1
+    assert np.allclose(hist.sum(axis=1), weights[:, inside].sum(axis=1))
+    try:
+        histogramdd(sample, bins=[np.array([-1., 0., 2.])], weights=weights,
+                    binning='linear')
+        assert False
+    except ValueError:
+        pass
@@ -1,5 +1,7 @@
 import numpy as np
-from jumpdiff import jd_process
+from functools import partial
+from jumpdiff import jd_process, jd_process_blocks, jd_ensemble
+from jumpdiff import jd_ou_process
 
 def test_jdprocess():
     for delta in [1,0.1,0.01,0.001,0.0001]:
@@ -31,3 +33,124 @@ def test_jdprocess():
 
             assert isinstance(X, np.ndarray)
             assert X.shape[0] == int(t_final/delta_t)
+
+def test_jdprocess_paths():
+    for scheme in ['Euler', 'Milstein']:
+        # drift, diffusion and its derivative must now take arrays
+        a = lambda x: -0.5*x
+        b = lambda x: 0.75
+        b_prime = lambda x: 0.
+
+        X = jd_process(100, 0.01, a=a, b=b, xi=1.5, lamb=1.25, init=0.,
+                solver=scheme, b_prime=b_prime, n_paths=200)
+
+        assert X.shape == (200, 10000)
+        assert np.all(X[:, 0] == 0.)
+        # stationary variance of the OU process with jumps
+        assert np.isclose(X[:, 2000:].var(), (0.75**2 + 1.5*1.25), rtol=0.2)
+
+        out = np.empty((3, 10000))
+        assert jd_process(100, 0.01, a=a, b=b, xi=1.5, lamb=1.25, init=0.,
+                solver=scheme, b_prime=b_prime, n_paths=3, out=out) is out
+
+def test_jdprocess_jumps():
+    # without drift and diffusion the increments are the jumps alone
+    a = lambda x: 0.
+    b = lambda x: 0.
+    np.random.seed(7)
+    for lamb in [0.5, 20.]:
+        X = jd_process(1000, 0.01, a=a, b=b, xi=1.5, lamb=lamb, init=0.)
+        dX = np.diff(X)
+
+        assert np.isclose(dX.var(), 1.5*lamb*0.01, rtol=0.1)
+        assert np.isclose(np.mean(dX != 0.), 1 - np.exp(-lamb*0.01),
+                rtol=0.1)
+
+def test_jdprocess_seed():
+    a = lambda x: -0.5*x
+    b = lambda x: 0.75
+    for n_paths in [None, 4]:
+        X = jd_process(10, 0.01, a=a, b=b, xi=1.5, lamb=1.25, seed=42,
+                n_paths=n_paths)
+        Y = jd_process(10, 0.01, a=a, b=b, xi=1.5, lamb=1.25,
+                seed=np.random.default_rng(42), n_paths=n_paths)
+        assert np.array_equal(X, Y)
+
+    # picklable drift and diffusion, to integrate on processes
+    a = partial(np.multiply, -0.5)
+    b = partial(np.full_like, fill_value=0.75)
+    X = jd_ensemble(10, 10, 0.01, a=a, b=b, xi=1.5, lamb=1.25, seed=7,
+            batch_size=3)
+    assert X.shape == (10, 1000)
+    assert np.unique(X[:, -1]).size == 10
+    for n_jobs in [2, -1]:
+        Y = jd_ensemble(10, 10, 0.01, a=a, b=b, xi=1.5, lamb=1.25, seed=7,
+                batch_size=3, n_jobs=n_jobs)
+        assert np.array_equal(X, Y)
+
+def test_jdprocess_blocks(tmp_path):
+    a = lambda x: -0.5*x
+    b = lambda x: 0.75
+    for n_paths in [None, 3]:
+        # a single block draws the same noise as the full integration
+        X = jd_process(10, 0.01, a=a, b=b, xi=1.5, lamb=1.25, seed=1,
+                n_paths=n_paths)
+        Y = jd_process(10, 0.01, a=a, b=b, xi=1.5, lamb=1.25, seed=1,
+                n_paths=n_paths, block_size=1000)
+        assert np.array_equal(X, Y)
+
+        blocks = list(jd_process_blocks(10, 0.01, a=a, b=b, xi=1.5, lamb=1.25,
+                seed=1, n_paths=n_paths, block_size=7, decimate=3))
+        X = np.concatenate(blocks, axis=-1)
+        assert X.shape[-1] == 334
+        Y = jd_process(10, 0.01, a=a, b=b, xi=1.5, lamb=1.25, seed=1,
+                n_paths=n_paths, block_size=7, decimate=3)
+        assert np.array_equal(X, Y)
+
+    # without noise, decimating is subsampling the full timeseries
+    b = lambda x: 0.
+    X = jd_process(10, 0.01, a=a, b=b, xi=0., lamb=0., init=1.)
+    Y = jd_process(10, 0.01, a=a, b=b, xi=0., lamb=0., init=1., block_size=5,
+            decimate=7, out=str(tmp_path / 'X.npy'))
+    assert np.allclose(X[::7], Y)
+    assert np.array_equal(np.load(tmp_path / 'X.npy'), Y)
+
+def test_jd_ou_process():
+    # exact statistics even at a coarse delta_t
+    X = jd_ou_process(10000, 0.5, theta=0.5, sigma=0.75, xi=1.5, lamb=1.25,
+            n_paths=10, seed=0)
+    assert X.shape == (10, 20000)
+    X = X[:, 100:]
+    assert np.isclose(X.var(), (0.75**2 + 1.5*1.25), rtol=0.1)
+    assert np.isclose(np.mean(X[:, 1:]*X[:, :-1])/X.var(), np.exp(-0.25),
+            rtol=0.05)
+
+    # without mean reversion the increments are independent
+    X = jd_ou_process(10000, 0.5, theta=0., sigma=0.75, xi=1.5, lamb=1.25,
+            init=0., seed=0)
+    assert X[0] == 0.
+    assert np.isclose(np.diff(X).var(), (0.75**2 + 1.5*1.25)*0.5, rtol=0.1)
+
+    X = jd_ou_process(1000, 0.1, theta=1., sigma=0.1, xi=0., lamb=0., mu=3.,
+            init=3.)
+    assert np.isclose(X.mean(), 3., atol=0.05)
+
+def test_jdprocess_table():
+    # linear drift and constant diffusion tabulated over a wide grid
+    grid = np.linspace(-50, 50, 1001)
+    a = lambda x: -0.5*x
+    b = lambda x: 0.75 + 0.*x
+    for n_paths in [None, 600]:
+        for scheme in ['Euler', 'Milstein']:
+            X = jd_process(10, 0.01, a=a, b=b, xi=1.5, lamb=1.25, seed=3,
+                    solver=scheme, b_prime=lambda x: 0.*x, n_paths=n_paths)
+            Y = jd_process(10, 0.01, a=(grid, a(grid)), b=(grid, b(grid)),
+                    xi=1.5, lamb=1.25, seed=3, solver=scheme, n_paths=n_paths)
+            assert np.allclose(X, Y)
+
+    # tables of shape (bins, lags), as given by moments
+    edges = np.stack([grid, grid], axis=1)
+    X = jd_process(10, 0.01, a=a, b=b, xi=1.5, lamb=1.25, seed=3)
+    Y = jd_process(10, 0.01, a=(edges, a(edges)), b=(edges, b(edges)),
+            xi=1.5, lamb=1.25, seed=3)
+    assert np.allclose(X, Y)
@@ -15,3 +15,45 @@ def test_kernels():
                 kernel_ = kernel(mesh, bw=bw).reshape(
                     *(edge.size for edge in edges))
                 assert np.allclose(kernel_.sum() * dx, 1, atol=1e-2)
+
+def test_kernel_cache():
+    from jumpdiff.kernels import (_kernel, _kernel_spectrum, _kernel_cache,
+        clear_kernel_cache, set_kernel_cache_size)
+
+    edges = [np.linspace(-1, 1, 101)]
+    clear_kernel_cache()
+
+    kernel_ = _kernel(edges, epanechnikov, 0.3)
+    assert _kernel(edges, epanechnikov, 0.3) is kernel_
+    assert _kernel(edges, epanechnikov, 0.2) is not kernel_
+    assert not kernel_.flags.writeable
+
+    spectrum, shape = _kernel_spectrum(edges, epanechnikov, 0.3)
+    assert shape[0] >= 100 + (kernel_.size - 1) // 2
+
+    # least recently used kernels are dropped first
+    set_kernel_cache_size(2)
+    assert len(_kernel_cache) == 2
+    assert _kernel(edges, epanechnikov, 0.3) is kernel_
+
+    clear_kernel_cache()
+    assert len(_kernel_cache) == 0
+    set_kernel_cache_size(32)
+
+def test_kernel_compact():
+    from jumpdiff.kernels import _kernel, clear_kernel_cache
+
+    edges = [np.linspace(-5, 5, 1001)]
+    dx = edges[0][1] - edges[0][0]
+    clear_kernel_cache()
+
+    for kernel in [epanechnikov, quartic, uniform, triagular]:
+        for bw in [0.05, 0.5, 50]:
+            kernel_ = _kernel(edges, kernel, bw)
+            assert kernel_.size <= min(2 * np.ceil(bw / dx) + 3,
+                                       2 * edges[0].size + 1)
+            assert np.isclose(kernel_.sum(), 1)
+            if bw < 5:
+                assert kernel_[0] == 0 and kernel_[-1] == 0
+
+    assert _kernel(edges, gaussian, 0.05).size == 2 * edges[0].size + 1
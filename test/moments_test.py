@@ -36,3 +36,382 @@ def test_moments():
 
             assert isinstance(edges, np.ndarray)
             assert isinstance(m, np.ndarray)
+
+def test_moments_lags():
+    X = np.cumsum(np.random.normal(size = 10000))
+
+    edges, m = moments(timeseries = X, lag = [1,2,5])
+
+    assert edges.shape == (5000, 3)
+    assert m.shape == (7, 5000, 3)
+
+    # all lags share the same grid
+    assert (edges == edges[:, :1]).all()
+
+    # each lag matches a single-lag estimation
+    for i, lag in enumerate([1,2,5]):
+        edges_, m_ = moments(timeseries = X, lag = [lag])
+        assert np.allclose(edges_[:, 0], edges[:, i])
+        assert np.allclose(m_[..., 0], m[..., i])
+
+def test_moments_bins():
+    from jumpdiff import MomentsAccumulator, rolling_moments, ensemble_moments
+
+    X = np.cumsum(np.random.normal(size = 3000))
+    bounds = (X[:-1].min(), X[:-1].max())
+
+    # an integer number of bins, as for histogramdd
+    edges, m = moments(timeseries = X, bins = np.array([100]))
+    edges_, m_ = moments(timeseries = X, bins = 100)
+    assert m_.shape == (7, 100, 1)
+    assert np.allclose(edges_, edges) and np.allclose(m_, m)
+
+    _, m_ = ensemble_moments(timeseries = [X, X[:500]], bw = 0.5, bins = 100)
+    assert m_.shape == (7, 100, 1)
+
+    _, m_ = next(rolling_moments(timeseries = X, window = 1000, step = 1000,
+        bw = 0.5, bins = 100))
+    assert m_.shape == (7, 100, 1)
+
+    _, m_ = MomentsAccumulator(bounds, 0.5, bins = 100).update(X).finalize()
+    assert m_.shape == (7, 100, 1)
+
+def test_moments_chunks():
+    X = np.cumsum(np.random.normal(size = 10000))
+
+    edges, m = moments(timeseries = X, lag = [1,3])
+
+    for chunk_size in [1, 999, 10000, 20000]:
+        edges_, m_ = moments(timeseries = X, lag = [1,3],
+            chunk_size = chunk_size)
+
+        assert (edges_ == edges).all()
+        assert np.allclose(m_, m)
+
+def test_moments_stream():
+    import os, tempfile
+    from jumpdiff.kernels import silvermans_rule
+
+    X = np.cumsum(np.random.normal(size = 10001))
+    edges, m = moments(timeseries = X, lag = [1,3])
+
+    with tempfile.TemporaryDirectory() as path:
+        path = os.path.join(path, 'X.npy')
+        np.save(path, X)
+
+        # from a path, and a memory-mapped array, with a prescan
+        for X_ in [path, np.load(path, mmap_mode = 'r')]:
+            edges_, m_ = moments(timeseries = X_, lag = [1,3],
+                chunk_size = 999)
+
+            assert np.allclose(edges_, edges)
+            assert np.allclose(m_, m)
+
+    # from an iterator of blocks, with fixed bounds and bandwidth
+    blocks = iter(np.array_split(X, 7))
+    edges_, m_ = moments(timeseries = blocks, lag = [1,3],
+        bw = silvermans_rule(X), bounds = (X[:-1].min(), X[:-1].max()))
+
+    assert np.allclose(edges_, edges)
+    assert np.allclose(m_, m)
+
+def test_moments_accumulator():
+    import pickle
+    from jumpdiff import MomentsAccumulator
+    from jumpdiff.kernels import silvermans_rule
+
+    X = np.cumsum(np.random.normal(size = 10001))
+    bw, bounds = silvermans_rule(X), (X[:-1].min(), X[:-1].max())
+
+    edges, m = moments(timeseries = X, lag = [1,3])
+
+    # segments accumulated apart, shipped and merged in order
+    splits = [0, 2501, 2502, 7000, 10001]
+    accs = [MomentsAccumulator(bounds, bw, lag = [1,3], offset = start)
+        .update(X[start:end]) for start, end in zip(splits[:-1], splits[1:])]
+
+    accs[1].chunk_size = 1000
+    accs[1] = MomentsAccumulator.from_dict(accs[1].to_dict())
+    assert accs[1].chunk_size == 1000
+    accs[2] = pickle.loads(pickle.dumps(accs[2]))
+
+    acc = accs[0]
+    for acc_ in accs[1:]:
+        acc.merge(acc_)
+
+    edges_, m_ = acc.finalize()
+
+    assert acc.n == X.size
+    assert np.allclose(edges_, edges)
+    assert np.allclose(m_, m)
+
+    # independent segments are pooled, and the result no longer updated
+    acc = MomentsAccumulator(bounds, bw, lag = [1,3]).update(X[:5000])
+    acc.merge(MomentsAccumulator(bounds, bw, lag = [1,3]).update(X[5000:]))
+    acc = MomentsAccumulator.from_dict(acc.to_dict())
+    assert acc.n is None and acc.chunk_size is None
+    acc.merge(MomentsAccumulator(bounds, bw, lag = [1,3],
+        offset = X.size).update(X[:10]))
+    assert acc.n is None and acc.carry == [None, None]
+
+    try:
+        acc.update(X[:10])
+        assert False
+    except AssertionError as e:
+        assert "independent" in str(e)
+
+def test_rolling_moments():
+    from jumpdiff import rolling_moments
+    from jumpdiff.kernels import silvermans_rule
+
+    X = np.cumsum(np.random.normal(size = 5000))
+    bw, bounds = silvermans_rule(X), (X[:-1].min(), X[:-1].max())
+
+    for window, step in [(1000, 6), (1000, 1200)]:
+        windows = list(rolling_moments(timeseries = X, window = window,
+            step = step, lag = [1,2,3], bins = np.array([500])))
+
+        assert len(windows) == (X.size - window) // step + 1
+
+        for i, (edges, m) in enumerate(windows):
+            edges_, m_ = moments(timeseries = X[i*step:i*step + window],
+                lag = [1,2,3], bw = bw, bounds = bounds, bins = np.array([500]))
+
+            assert np.allclose(edges, edges_)
+            assert np.allclose(m, m_)
+
+def test_moments_conv_methods():
+    from jumpdiff.kernels import epanechnikov, gaussian, quartic
+
+    X = np.cumsum(np.random.normal(size = 10000))
+
+    for kernel in [epanechnikov, gaussian, quartic]:
+        for bw in [0.05, 2.0]:
+            _, m = moments(timeseries = X, bw = bw, kernel = kernel,
+                conv_method = 'fft', correction = False)
+
+            # away from the tails, where transforms are dominated by round-off
+            mask = m[0] > 1e-3 * m[0].max()
+
+            for conv_method in ['auto', 'direct', 'oa']:
+                _, m_ = moments(timeseries = X, bw = bw, kernel = kernel,
+                    conv_method = conv_method, correction = False)
+
+                assert np.allclose(m_[:, mask], m[:, mask])
+
+def test_moments_parallel():
+    from concurrent.futures import ProcessPoolExecutor
+
+    X = np.cumsum(np.random.normal(size = 10000))
+
+    edges, m = moments(timeseries = X, lag = [1,2,3,5])
+
+    edges_, m_ = moments(timeseries = X, lag = [1,2,3,5], n_jobs = 2)
+    assert np.allclose(edges_, edges)
+    assert np.allclose(m_, m)
+
+    with ProcessPoolExecutor(2) as executor:
+        edges_, m_ = moments(timeseries = X, lag = [1,2,3,5],
+            executor = executor)
+        assert np.allclose(edges_, edges)
+        assert np.allclose(m_, m)
+
+    # copying the lags to the processes, without shared memory before 3.8
+    from importlib import import_module
+    module = import_module('jumpdiff.moments')
+    shared_memory = module.SharedMemory
+    try:
+        module.SharedMemory = None
+        with ProcessPoolExecutor(2) as executor:
+            edges_, m_ = moments(timeseries = X, lag = [1,2,3,5],
+                executor = executor)
+    finally:
+        module.SharedMemory = shared_memory
+    assert np.allclose(m_, m)
+
+    # workers forked before the shared memory leave it to the parent, with no
+    # leak reported by their resource trackers on exit
+    import subprocess, sys
+    from multiprocessing import get_all_start_methods
+    if 'fork' in get_all_start_methods():
+        script = (
+            "import os, numpy as np, multiprocessing as mp\n"
+            "from concurrent.futures import ProcessPoolExecutor\n"
+            "from jumpdiff import moments\n"
+            "X = np.cumsum(np.random.normal(size = 1000))\n"
+            "with ProcessPoolExecutor(2, mp_context = mp.get_context('fork'))"
+            " as executor:\n"
+            "    [executor.submit(os.getpid).result() for _ in range(4)]\n"
+            "    moments(timeseries = X, lag = [1,2,3], executor = executor)\n")
+        result = subprocess.run([sys.executable, '-c', script],
+            capture_output = True, text = True)
+        assert result.returncode == 0, result.stderr
+        assert 'resource_tracker' not in result.stderr
+
+def test_ensemble_moments():
+    from jumpdiff import ensemble_moments
+
+    X = np.cumsum(np.random.normal(size = (5, 2000)), axis = 1)
+    bounds = (X[:, :-1].min(), X[:, :-1].max())
+
+    edges, m = ensemble_moments(timeseries = X, bw = 0.5, lag = [1,3],
+        mode = 'series')
+
+    assert edges.shape == (5000, 2)
+    assert m.shape == (5, 7, 5000, 2)
+
+    for k in range(5):
+        edges_, m_ = moments(timeseries = X[k], bw = 0.5, lag = [1,3],
+            bounds = bounds)
+        assert np.allclose(edges_, edges)
+        assert np.allclose(m_, m[k])
+
+    # pooling series of different lengths, with increments only within each,
+    # as independent accumulators
+    from jumpdiff import MomentsAccumulator
+
+    series = [X[0], X[1, :500], X[2, :1]]
+    edges, m = ensemble_moments(timeseries = series, bw = 0.5, lag = [1,3],
+        bounds = bounds)
+
+    acc = MomentsAccumulator(bounds, 0.5, lag = [1,3]).update(series[0])
+    for X_ in series[1:]:
+        acc.merge(MomentsAccumulator(bounds, 0.5, lag = [1,3]).update(X_))
+    edges_, m_ = acc.finalize()
+
+    assert np.allclose(edges_, edges)
+    assert np.allclose(m_, m)
+
+def test_moments_at():
+    from jumpdiff import moments_at, jd_ou_process
+    from jumpdiff.kernels import gaussian
+
+    X = jd_ou_process(100, 0.001, theta=0.5, sigma=0.75, xi=1.5, lamb=1.25,
+            seed=0)
+    lag = [1, 5, 20]
+    edges, m = moments(X, bw=0.1, lag=lag)
+
+    # at the centres of some bins, equal up to the binning of moments
+    x = edges[::250, 0]
+    m_at = moments_at(X, x, bw=0.1, lag=lag)
+    assert m_at.shape == (7, x.size, 3)
+
+    dense = m[0, ::250] > 1e-2 * m[0].max(axis=0)
+    for p in range(1, 7):
+        error = np.abs(m_at[p] - m[p, ::250])[dense]
+        assert error.max() < 0.05 * np.abs(m[p, ::250][dense]).max()
+
+    # reusing the sort, and outside the timeseries
+    order = np.argsort(X)
+    m_at_ = moments_at(X, x[10:12], bw=0.1, lag=lag, order=order)
+    assert np.allclose(m_at_, m_at[:, 10:12])
+    assert np.all(moments_at(X, [100.], bw=0.1, order=order) == 0.)
+
+    # a last point with no samples leaves the others unchanged
+    m_at_ = moments_at(X, np.append(x[10:12], 100.), bw=0.1, lag=lag)
+    assert np.allclose(m_at_[:, :2], m_at[:, 10:12])
+    assert np.all(m_at_[:, 2] == 0.)
+
+    m_at = moments_at(X, x, bw=0.1, lag=lag, kernel=gaussian)
+    assert np.all(np.isfinite(m_at))
+
+def test_moments_bandwidths():
+    X = jd_process(100, 0.001, a=lambda x: -0.5*x, b=lambda x: 0.75, xi=1.5,
+            lamb=1.25, seed=0)
+    bws = np.array([0.02, 0.05, 0.1])
+
+    edges, m = moments(X, bw=bws, lag=[1, 3])
+    assert m.shape == (3, 7, 5000, 2)
+
+    # each equals moments on the same grid, spanning the largest bandwidth
+    lo, hi = X[:-1].min(), X[:-1].max()
+    for k, bw in enumerate(bws):
+        d = bws.max() - bw
+        edges_, m_ = moments(X, bw=bw, lag=[1, 3], bounds=(lo - d, hi + d))
+        assert np.allclose(edges, edges_)
+        assert np.allclose(m[k], m_)
+
+def test_moments_orders():
+    from jumpdiff import jump_amplitude
+
+    X = jd_process(100, 0.001, a=lambda x: -0.5*x, b=lambda x: 0.75, xi=1.5,
+            lamb=1.25, seed=0)
+
+    for correction in [True, False]:
+        for norm in [True, False]:
+            _, m = moments(X, bw=0.05, lag=[1, 2], power=2,
+                    correction=correction, norm=norm)
+            _, m_ = moments(X, bw=0.05, lag=[1, 2], power=[0, 1, 2],
+                    correction=correction, norm=norm)
+            assert np.allclose(m_, m)
+
+            _, m = moments(X, bw=0.05, lag=[1, 2], correction=correction,
+                    norm=norm)
+
+            # only the orders asked for, and those their corrections take
+            _, m_ = moments(X, bw=0.05, lag=[1, 2], power=[4, 6],
+                    correction=correction, norm=norm)
+            assert m_.shape == m.shape
+            computed = [0, 1, 2, 3, 4, 5, 6] if correction else [0, 4, 6]
+            assert np.allclose(m_[computed], m[computed])
+            missing = [i for i in range(7) if i not in computed]
+            assert np.all(np.isnan(m_[missing]))
+
+    # orders above the sixth are not corrected, listed or not
+    _, m = moments(X, bw=0.05, power=8)
+    _, m_ = moments(X, bw=0.05, power=[0, 8])
+    _, m_uncorrected = moments(X, bw=0.05, power=8, correction=False)
+    assert np.allclose(m_[[0, 8]], m[[0, 8]])
+    assert np.allclose(m[7:], m_uncorrected[7:])
+    assert np.any(m[8] != 0.)
+
+    _, m = moments(X, bw=0.05, correction=False)
+    _, m_ = moments(X, bw=0.05, correction=False, power=[0, 4, 6])
+    assert np.isclose(jump_amplitude(m_), jump_amplitude(m))
+
+    _, m = moments(X, bw=[0.02, 0.05], correction=False)
+    _, m_ = moments(X, bw=[0.02, 0.05], correction=False, power=[3])
+    assert np.allclose(m_[:, [0, 3]], m[:, [0, 3]])
+
+def test_cv_bandwidth():
+    from jumpdiff import cv_bandwidth
+    from jumpdiff.kernels import epanechnikov, _kernel
+    from jumpdiff.moments import _grid
+
+    # Leave-one-out error of the binned regressions, sample by sample
+    X = jd_process(10, 0.01, a=lambda x: 4 * np.sin(3 * x),
+                   b=lambda x: 1 + 0 * x, xi=0., lamb=0., seed=1)
+    bws = np.array([0.05, 0.1, 0.3])
+    bw, candidates, scores = cv_bandwidth(X, bws, bins=np.array([200]),
+                                          scores=True)
+    assert bw == candidates[np.argmin(scores)]
+
+    edges = _grid(X[:-1, None], np.array([200]), bws.max())
+    index = np.digitize(X[:-1], edges[0]) - 1
+    d = np.diff(X)
+    for b, score in zip(bws, scores):
+        kernel_ = _kernel(edges, epanechnikov, b)
+        h = (kernel_.size - 1) // 2
+        loo = 0.
+        for p in [1, 2]:
+            y = d**p
+            for i in range(d.size):
+                offset = index - index[i] + h
+                w = np.where((offset >= 0) & (offset < kernel_.size),
+                             kernel_[np.clip(offset, 0, kernel_.size - 1)], 0.)
+                w[i] = 0.
+                pred = (w @ y) / w.sum() if w.sum() > 1e-6 * kernel_[h] \
+                    else y.mean()
+                loo += np.sum((y[i] - pred)**2) / d.size / y.var()
+        assert np.isclose(score, loo)
+
+    # A curved drift has its best bandwidth inside the candidates
+    X = jd_process(2000, 0.01, a=lambda x: 4 * np.sin(3 * x),
+                   b=lambda x: 1 + 0 * x, xi=0., lamb=0., seed=1)
+    bws = np.logspace(-2.5, 0, 16)
+    bw, _, scores = cv_bandwidth(X, bws, scores=True)
+    assert bws[0] < bw < bws[-1]
+
+    edges, m = moments(X, bw=cv_bandwidth)
+    _, m_ = moments(X, bw=cv_bandwidth(X))
+    assert np.allclose(m, m_)